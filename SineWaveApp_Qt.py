@@ -6,6 +6,82 @@ from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 import os
 import soundfile as sf
 import collections
+import queue
+import struct
+import tempfile
+import threading
+from time import perf_counter, sleep
+from audio_dsp import (
+    pan_gains, parse_channel_list, PolyphaseResampler, BlockProfiler, MappedSample,
+    SampleVoice, BiquadFilter, StereoDelay, Reverb
+)
+
+SAMPLING_RATES = [44100, 48000, 96000, 192000]
+MAX_OUTPUT_CHANNELS = 16
+
+
+class RecordingWriter:
+    # the audio callback only queues blocks, a writer thread does the blocking disk writes
+    def __init__(self, filename, samplerate, channels):
+        self.file = sf.SoundFile(filename, "w", samplerate=samplerate, channels=channels, subtype="FLOAT")
+        self.blocks = queue.Queue()
+        self.frames = 0
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def write(self, block):
+        self.blocks.put_nowait(block)
+
+    def _run(self):
+        while True:
+            block = self.blocks.get()
+            if block is None:
+                break
+            self.file.write(block)
+            self.frames += len(block)
+
+    def close(self):
+        self.blocks.put(None)
+        self.thread.join()
+        self.file.close()
+
+
+class FileSink:
+    # stands in for sd.OutputStream and writes the callback output to a WAV file
+    def __init__(self, filename, samplerate, channels, callback, blocksize, realtime=True):
+        self.file = sf.SoundFile(filename, "w", samplerate=samplerate, channels=channels, subtype="FLOAT")
+        self.samplerate = samplerate
+        self.channels = channels
+        self.callback = callback
+        self.blocksize = blocksize
+        self.realtime = realtime
+        self.active = False
+        self.thread = None
+
+    def start(self):
+        self.active = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        outdata = np.zeros((self.blocksize, self.channels), dtype=np.float32)
+        deadline = perf_counter()
+        while self.active:
+            self.callback(outdata, self.blocksize, None, None)
+            self.file.write(outdata)
+            if self.realtime:
+                deadline += self.blocksize / self.samplerate
+                sleep(max(deadline - perf_counter(), 0))
+
+    def stop(self):
+        self.active = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def close(self):
+        self.file.close()
+
 
 class SineWaveApp(QtWidgets.QWidget):
     def __init__(self):
@@ -13,6 +89,15 @@ class SineWaveApp(QtWidgets.QWidget):
         self.setWindowTitle("Waveform Generator")
 
         self.sampling_rate = 48000
+        self.blocksize = 1024
+        self.output_channels = 2
+        # None plays through the system default output device
+        self.output_device = None
+        # (signal numbers, signals x outputs gain matrix), swapped as one tuple by update_routing
+        self.routing = ((), np.zeros((0, self.output_channels)))
+        self.plot_duration = 0.05
+        # rate dependent tables (time axes, later filter coefficients) built once per rate
+        self.rate_tables = {}
 
         self.clip_buffer = collections.deque(maxlen=self.sampling_rate)
 
@@ -21,11 +106,20 @@ class SineWaveApp(QtWidgets.QWidget):
             1: self.create_default_signal_parameters()
         }
 
+        # insert filters per signal and the post-mix chain, built per stream in build_effects
+        self.signal_filters = {}
+        self.master_effects = []
+        # sample playback voices per signal, mapped files shared by path
+        self.sample_voices = {}
+        self.sample_files = {}
+        self.profiler = BlockProfiler()
+
         self.running = False
         self.time_offset = 0
         self.scrolling_plot = False
         self.recording = False
-        self.recorded_frames = []
+        self.record_writer = None
+        self.record_path = None
 
         self.key_status = {}
         self.current_octave_shift = 5
@@ -80,6 +174,38 @@ class SineWaveApp(QtWidgets.QWidget):
         self.toggle_plot_button.clicked.connect(self.toggle_plot_mode)
         button_layout.addWidget(self.toggle_plot_button)
 
+        self.rate_combobox = QtWidgets.QComboBox()
+        self.rate_combobox.setToolTip("Select the sampling rate")
+        for rate in SAMPLING_RATES:
+            self.rate_combobox.addItem(f"{rate / 1000:g} kHz", rate)
+        self.rate_combobox.setCurrentIndex(SAMPLING_RATES.index(self.sampling_rate))
+        self.rate_combobox.currentIndexChanged.connect(lambda index: self.set_sampling_rate(self.rate_combobox.itemData(index)))
+        button_layout.addWidget(self.rate_combobox)
+
+        output_layout = QtWidgets.QHBoxLayout()
+        self.output_combobox = QtWidgets.QComboBox()
+        self.output_combobox.setToolTip("Play through the audio device or write the output to a WAV file")
+        self.output_combobox.addItem("Audiogerät", "device")
+        self.output_combobox.addItem("Datei", "file")
+        output_layout.addWidget(self.output_combobox)
+
+        self.device_combobox = QtWidgets.QComboBox()
+        self.device_combobox.setToolTip("Output device for playback")
+        self.device_combobox.addItem("Standardgerät", None)
+        for index, device in enumerate(sd.query_devices()):
+            if device['max_output_channels'] > 0:
+                self.device_combobox.addItem(f"{device['name']} ({device['max_output_channels']})", index)
+        self.device_combobox.currentIndexChanged.connect(lambda index: self.set_output_device(self.device_combobox.itemData(index)))
+        output_layout.addWidget(self.device_combobox)
+
+        self.channels_spinbox = QtWidgets.QSpinBox()
+        self.channels_spinbox.setToolTip("Number of output channels")
+        self.channels_spinbox.setRange(1, MAX_OUTPUT_CHANNELS)
+        self.channels_spinbox.setValue(self.output_channels)
+        self.channels_spinbox.setSuffix(" Kanäle")
+        self.channels_spinbox.valueChanged.connect(self.set_output_channels)
+        output_layout.addWidget(self.channels_spinbox)
+
         add_tab_button = QtWidgets.QPushButton("+")
         add_tab_button.setToolTip("Add a new signal")
         add_tab_button.clicked.connect(self.add_new_signal)
@@ -89,12 +215,31 @@ class SineWaveApp(QtWidgets.QWidget):
         self.tab_widget.tabCloseRequested.connect(self.remove_signal_tab)
 
         left_layout.addLayout(button_layout)
+        left_layout.addLayout(output_layout)
 
         self.octave_label = QtWidgets.QLabel(f"Aktuelle Oktave: {self.octave_names[self.current_octave_shift]}")
         self.octave_label.setAlignment(QtCore.Qt.AlignCenter)
         left_layout.addWidget(self.octave_label)
 
 
+        # post-mix effects
+        effects_group = QtWidgets.QGroupBox("Effekte")
+        effects_layout = QtWidgets.QFormLayout()
+        self.effect_controls = {}
+        self.create_slider_and_spinbox(effects_layout, "Delay Zeit L", None, 'delay_time_left', 1, 2000, 1, "ms", 0, 300, controls=self.effect_controls)
+        self.create_slider_and_spinbox(effects_layout, "Delay Zeit R", None, 'delay_time_right', 1, 2000, 1, "ms", 0, 450, controls=self.effect_controls)
+        self.create_slider_and_spinbox(effects_layout, "Delay Feedback", None, 'delay_feedback', 0.0, 0.95, 0.01, "", 2, 0.3, controls=self.effect_controls)
+        self.create_slider_and_spinbox(effects_layout, "Delay Mix", None, 'delay_mix', 0.0, 1.0, 0.01, "", 2, 0.0, controls=self.effect_controls)
+        self.create_slider_and_spinbox(effects_layout, "Hall Raumgröße", None, 'reverb_room_size', 0.0, 1.0, 0.01, "", 2, 0.5, controls=self.effect_controls)
+        self.create_slider_and_spinbox(effects_layout, "Hall Mix", None, 'reverb_mix', 0.0, 1.0, 0.01, "", 2, 0.0, controls=self.effect_controls)
+        effects_group.setLayout(effects_layout)
+        left_layout.addWidget(effects_group)
+
+        self.dsp_load_label = QtWidgets.QLabel(" ")
+        self.dsp_load_label.setToolTip("Share of the real-time budget used per audio block")
+        self.dsp_load_label.setAlignment(QtCore.Qt.AlignCenter)
+        left_layout.addWidget(self.dsp_load_label)
+
         # Clipping indicator
         self.clipping_label = QtWidgets.QLabel(" ")
         self.clipping_label.setStyleSheet("color: red; font-weight: bold;")
@@ -106,7 +251,7 @@ class SineWaveApp(QtWidgets.QWidget):
         self.canvas = FigureCanvas(self.fig)
         self.line, = self.ax.plot([], [])
         self.ax.set_ylim(-1.5, 1.5)
-        self.ax.set_xlim(0, 0.05)
+        self.ax.set_xlim(0, self.plot_duration)
         self.ax.set_xlabel("Time in s")
         self.ax.set_ylabel("Amplitude")
         right_layout = QtWidgets.QVBoxLayout()
@@ -172,6 +317,8 @@ class SineWaveApp(QtWidgets.QWidget):
     def set_frequency(self, signal_number, frequency):
         if signal_number in self.signal_controls:
             self.signal_controls[signal_number]['frequency_slider'].setValue(frequency)
+            if signal_number in self.sample_voices:
+                self.sample_voices[signal_number].retrigger()
             self.update_plot()
 
     def get_octave_name(self, shift):
@@ -195,6 +342,10 @@ class SineWaveApp(QtWidgets.QWidget):
         self.create_slider_and_spinbox(control_layout, "FM Modulationsfrequenz", signal_number, 'fm_mod_freq', 0.1, 100.0, 0.1, "Hz", 1, params.get('fm_mod_freq', 0.1))
         self.create_slider_and_spinbox(control_layout, "FM Modulationsindex", signal_number, 'fm_mod_index', 0.0, 10.0, 0.1, "", 1, params.get('fm_mod_index', 0.0))
         self.create_slider_and_spinbox(control_layout, "Harmonics", signal_number, 'harmonic_richness', 0, 10, 1, "", 0, params.get('harmonic_richness', 0))
+        self.create_slider_and_spinbox(control_layout, "Filter Cutoff", signal_number, 'filter_cutoff', 20, 20000, 1, "Hz", 0, params.get('filter_cutoff', 20000))
+        self.create_slider_and_spinbox(control_layout, "Filter Resonanz", signal_number, 'filter_resonance', 0.5, 10.0, 0.1, "", 1, params.get('filter_resonance', 0.7))
+        self.create_slider_and_spinbox(control_layout, "Filter LFO Frequenz", signal_number, 'filter_lfo_freq', 0.0, 20.0, 0.1, "Hz", 1, params.get('filter_lfo_freq', 0.0))
+        self.create_slider_and_spinbox(control_layout, "Filter LFO Tiefe", signal_number, 'filter_lfo_depth', 0.0, 4.0, 0.1, "Okt", 1, params.get('filter_lfo_depth', 0.0))
 
         pwm_label, pwm_slider, pwm_spinbox = self.create_slider_and_spinbox(control_layout, "PWM Pulsweite", signal_number, 'pwm_width', 1, 99, 1, "%", 0, params.get('pwm_width', 50))
         self.signal_controls[signal_number]['pwm_label'] = pwm_label
@@ -207,13 +358,23 @@ class SineWaveApp(QtWidgets.QWidget):
         self.signal_controls[signal_number]['volume_dial'] = volume_dial
 
         pan_dial, pan_spinbox = self.create_dial_with_spinbox(0.0, 1.0, params['pan'], "Adjust the panning of the signal between left and right", 0.01)
+        pan_spinbox.valueChanged.connect(self.update_routing)
         control_layout.addRow(f"Panning {signal_number} (L-R):", self.wrap_widget_with_label(pan_spinbox, pan_dial))
         self.signal_controls[signal_number]['pan_dial'] = pan_dial
 
+        # explicit outputs override the pan position
+        routing_edit = QtWidgets.QLineEdit(params.get('outputs', ""))
+        routing_edit.setPlaceholderText("Panning" if params.get('routing_gains') is None else "Eigene Gains")
+        routing_edit.setToolTip("Output channels for the signal, e.g. 1, 3-5. Empty uses the panning.")
+        routing_edit.setValidator(QtGui.QRegularExpressionValidator(QtCore.QRegularExpression(r"[0-9,\- ]*")))
+        routing_edit.textChanged.connect(self.update_routing)
+        control_layout.addRow(f"Ausgänge {signal_number}:", routing_edit)
+        self.signal_controls[signal_number]['routing_edit'] = routing_edit
+
         # waveform selection
         waveform_buttons = QtWidgets.QButtonGroup(self)
         waveform_layout = QtWidgets.QHBoxLayout()
-        for waveform in ["sine", "square", "triangle", "sawtooth"]:
+        for waveform in ["sine", "square", "triangle", "sawtooth", "sample"]:
             button = QtWidgets.QRadioButton(waveform)
             button.setToolTip(f"Select {waveform} waveform for signal {signal_number}")
             if waveform == params['waveform']:
@@ -224,6 +385,23 @@ class SineWaveApp(QtWidgets.QWidget):
         control_layout.addRow(f"Wellenform {signal_number}:", waveform_layout)
         self.signal_controls[signal_number]['waveform_buttons'] = waveform_buttons
 
+        # sample playback
+        sample_layout = QtWidgets.QHBoxLayout()
+        sample_button = QtWidgets.QPushButton("Laden")
+        sample_button.setToolTip("Load a WAV file for the sample waveform")
+        sample_button.clicked.connect(lambda _, number=signal_number: self.load_sample(number))
+        sample_layout.addWidget(sample_button)
+        sample_label = QtWidgets.QLabel(os.path.basename(params.get('sample_file', "")) or "-")
+        sample_layout.addWidget(sample_label)
+        loop_checkbox = QtWidgets.QCheckBox("Loop")
+        loop_checkbox.setToolTip("Loop the sample instead of playing it once per key press")
+        loop_checkbox.setChecked(params.get('sample_loop', True))
+        sample_layout.addWidget(loop_checkbox)
+        control_layout.addRow(f"Sample {signal_number}:", sample_layout)
+        self.signal_controls[signal_number]['sample_label'] = sample_label
+        self.signal_controls[signal_number]['sample_loop_checkbox'] = loop_checkbox
+        self.create_slider_and_spinbox(control_layout, "Sample Grundton", signal_number, 'sample_root', 20.0, 2000.0, 0.01, "Hz", 2, params.get('sample_root', 261.63))
+
         # mute button
         mute_button = QtWidgets.QPushButton()
         if params['mute']:
@@ -239,6 +417,7 @@ class SineWaveApp(QtWidgets.QWidget):
 
         tab.setLayout(control_layout)
         self.tab_widget.addTab(tab, f"Signal {signal_number}")
+        self.update_routing()
 
     def create_dial_with_spinbox(self, min_val, max_val, initial_value, tooltip, single_step, decimals=2):
         dial = QtWidgets.QDial()
@@ -258,7 +437,7 @@ class SineWaveApp(QtWidgets.QWidget):
 
         return dial, spinbox
 
-    def create_slider_and_spinbox(self, layout, label, signal_number, param_name, min_val, max_val, single_step, unit, decimals, initial_value):
+    def create_slider_and_spinbox(self, layout, label, signal_number, param_name, min_val, max_val, single_step, unit, decimals, initial_value, controls=None):
         slider = self.create_slider(min_val, max_val, initial_value, decimals)
         spinbox = QtWidgets.QDoubleSpinBox() if decimals > 0 else QtWidgets.QSpinBox()
         spinbox.setRange(min_val, max_val)
@@ -278,9 +457,11 @@ class SineWaveApp(QtWidgets.QWidget):
 
         layout.addRow(label_widget, self.wrap_widget_with_slider_and_spinbox(slider, spinbox))
 
-        self.signal_controls[signal_number][f'{param_name}_slider'] = slider
-        self.signal_controls[signal_number][f'{param_name}_spinbox'] = spinbox
-        self.signal_controls[signal_number][f'{param_name}_label'] = label_widget
+        if controls is None:
+            controls = self.signal_controls[signal_number]
+        controls[f'{param_name}_slider'] = slider
+        controls[f'{param_name}_spinbox'] = spinbox
+        controls[f'{param_name}_label'] = label_widget
         
         return label_widget, slider, spinbox
 
@@ -327,7 +508,7 @@ class SineWaveApp(QtWidgets.QWidget):
     def sawtooth_wave(self, freq, t):
         return 2 * (t * freq % 1) - 1
 
-    def generate_signal(self, t, signal_number):
+    def generate_signal(self, t, signal_number, playback=False):
         controls = self.signal_controls[signal_number]
         if controls['mute_checkbox'].isChecked():
             return np.zeros_like(t)
@@ -353,6 +534,15 @@ class SineWaveApp(QtWidgets.QWidget):
             self.set_slider_and_spinbox_visibility(pwm_label, pwm_slider, pwm_spinbox, False)
 
         fm_modulator_signal = fm_mod_index * np.sin(2 * np.pi * fm_mod_freq * t)
+        if waveform == "sample":
+            voice = self.sample_voices.get(signal_number)
+            if voice is None:
+                return np.zeros_like(t)
+            voice.root_frequency = controls['sample_root_slider'].value() / 100
+            voice.loop = controls['sample_loop_checkbox'].isChecked()
+            wave = voice.render(freq + fm_modulator_signal, self.sampling_rate, advance=playback)
+            return wave * modulator * volume
+
         if waveform == "sine":
             wave = self.sine_wave(freq + fm_modulator_signal, t + phase_shift / (2 * np.pi * freq))
         elif waveform == "square":
@@ -388,13 +578,45 @@ class SineWaveApp(QtWidgets.QWidget):
 
         return wave * volume
 
+    def get_rate_tables(self, fs):
+        tables = self.rate_tables.get(fs)
+        if tables is None:
+            tables = {
+                'plot_time': np.arange(int(self.plot_duration * fs)) / fs,
+                'block_time': np.arange(self.blocksize) / fs,
+                'filter_coefficients': {},
+                'effect_delays': {},
+            }
+            self.rate_tables[fs] = tables
+        return tables
+
+    def set_sampling_rate(self, rate):
+        if rate == self.sampling_rate:
+            return
+        if self.recording or self.file_sink_running():
+            # a recording or output file has to stay at one rate, keep the current one
+            QtWidgets.QMessageBox.warning(self, "Sampling Rate", "Stop the recording and the file output before changing the sampling rate.")
+            self.restore_output_controls()
+            return
+        if not self.output_settings_supported(self.output_device, rate, self.output_channels):
+            self.restore_output_controls()
+            return
+
+        was_running = self.running
+        self.stop()
+        self.sampling_rate = rate
+        self.clip_buffer = collections.deque(maxlen=self.sampling_rate)
+        if was_running:
+            self.start()
+        self.update_plot()
+
     def update_plot(self):
             fs = self.sampling_rate
             if self.scrolling_plot:
-                t = np.linspace(self.time_offset, self.time_offset + 0.05, int(0.05 * fs), endpoint=False)
+                t = self.get_rate_tables(fs)['plot_time'] + self.time_offset
                 self.time_offset += 0.0005  # for scrolling effect
             else:
-                t = np.linspace(0, 0.05, int(0.05 * fs), endpoint=False)
+                t = self.get_rate_tables(fs)['plot_time']
 
             combined_wave = np.zeros_like(t)
 
@@ -411,6 +633,12 @@ class SineWaveApp(QtWidgets.QWidget):
             self.ax.set_xlim(t[0], t[-1])
             self.canvas.draw()
 
+            load = self.profiler.load()
+            if self.running and 'total' in load:
+                self.dsp_load_label.setText(f"DSP-Last: {load['total'] * 100:.0f}%")
+            else:
+                self.dsp_load_label.setText(" ")
+
     def toggle_plot_mode(self):
         self.scrolling_plot = not self.scrolling_plot
         if not self.scrolling_plot:
@@ -426,51 +654,212 @@ class SineWaveApp(QtWidgets.QWidget):
 
     def audio_callback(self, outdata, frames, time, status):
         if not self.running:
-            outdata[:] = np.zeros((frames, 2))
+            outdata[:] = 0
             return
 
+        block_start = perf_counter()
         fs = self.sampling_rate
-        t = (np.arange(frames) + self.sample_offset) / fs
+        self.profiler.set_budget(frames, fs)
+        block_time = self.get_rate_tables(fs)['block_time']
+        t0 = self.sample_offset / fs
+        if frames == len(block_time):
+            t = block_time + t0
+        else:
+            t = (np.arange(frames) + self.sample_offset) / fs
         self.sample_offset += frames
 
-        left_channel = np.zeros_like(t)
-        right_channel = np.zeros_like(t)
+        signal_numbers, routing_matrix = self.routing
+        voices = np.zeros((frames, len(signal_numbers)))
 
-        for signal_number in list(self.signal_parameters.keys()):
-            wave = self.generate_signal(t, signal_number)
-            pan = self.signal_controls[signal_number]['pan_dial'].value() / 100
+        filter_time = 0.0
+        for column, signal_number in enumerate(signal_numbers):
+            wave = self.generate_signal(t, signal_number, playback=True)
 
-            left_gain = np.cos(pan * np.pi / 2) / np.sqrt(2)
-            right_gain = np.sin(pan * np.pi / 2) / np.sqrt(2)
+            stage_start = perf_counter()
+            signal_filter = self.get_signal_filter(signal_number)
+            self.update_filter_parameters(signal_filter, signal_number)
+            voices[:, column] = signal_filter.process(wave[:, None], t0)[:, 0]
+            filter_time += perf_counter() - stage_start
+        self.profiler.record('filter', filter_time)
 
-            left_channel += wave * left_gain
-            right_channel += wave * right_gain
-
-        num_active_signals = sum(1 for signal_number in self.signal_parameters if not self.signal_controls[signal_number]['mute_checkbox'].isChecked())
+        stage_start = perf_counter()
+        num_active_signals = sum(1 for signal_number in signal_numbers if not self.signal_controls[signal_number]['mute_checkbox'].isChecked())
         if num_active_signals > 1:
-            left_channel /= num_active_signals
-            right_channel /= num_active_signals
+            routing_matrix = routing_matrix / num_active_signals
+        mix = voices @ routing_matrix
+        self.profiler.record('mix', perf_counter() - stage_start)
+
+        self.update_effect_parameters()
+        for name, effect in self.master_effects:
+            stage_start = perf_counter()
+            mix = effect.process(mix, t0)
+            self.profiler.record(name, perf_counter() - stage_start)
 
-        left_channel = np.clip(left_channel, -1, 1)
-        right_channel = np.clip(right_channel, -1, 1)
+        mix = np.clip(mix, -1, 1)
 
-        if np.any(left_channel >= 0.95) or np.any(left_channel <= -0.95) or np.any(right_channel >= 0.95) or np.any(right_channel <= -0.95):
+        if np.any(np.abs(mix) >= 0.95):
             self.clipping_label.setText("Clipping Detected!")
         else:
             self.clipping_label.setText(" ")
 
+        outdata[:] = mix
+        self.profiler.record('total', perf_counter() - block_start)
+
+        record_writer = self.record_writer
+        if self.recording and record_writer is not None:
+            record_writer.write(mix)
 
-        stereo_wave = np.vstack((left_channel, right_channel)).T
 
-        outdata[:] = stereo_wave
+    def build_effects(self):
+        # processors allocate their delay lines and filter state once per stream
+        tables = self.get_rate_tables(self.sampling_rate)
+        self.signal_filters = {}
+        self.master_effects = [
+            ('delay', StereoDelay(self.sampling_rate, self.output_channels)),
+            ('reverb', Reverb(self.sampling_rate, tables['effect_delays'], self.output_channels)),
+        ]
+        self.profiler.reset()
+
+    def load_sample(self, signal_number):
+        filename, _ = QtWidgets.QFileDialog.getOpenFileName(self, "Load Sample", os.getenv("HOME"), "WAV Files (*.wav)")
+        if not filename:
+            return
+
+        sample = self.sample_files.get(filename)
+        if sample is None:
+            try:
+                sample = MappedSample(filename)
+            except (OSError, ValueError, struct.error) as error:
+                QtWidgets.QMessageBox.warning(self, "Sample", f"Could not load the sample: {error}")
+                return
+            self.sample_files[filename] = sample
+
+        controls = self.signal_controls[signal_number]
+        self.sample_voices[signal_number] = SampleVoice(sample, controls['sample_root_slider'].value() / 100, controls['sample_loop_checkbox'].isChecked())
+        self.signal_parameters[signal_number]['sample_file'] = filename
+        controls['sample_label'].setText(os.path.basename(filename))
+        for button in controls['waveform_buttons'].buttons():
+            if button.text() == "sample":
+                button.setChecked(True)
+        self.update_plot()
+
+    def update_routing(self):
+        # build the whole matrix first and swap it in with one assignment,
+        # the audio callback always sees a consistent (signals, matrix) pair
+        signal_numbers = tuple(signal_number for signal_number in self.signal_parameters if signal_number in self.signal_controls)
+        matrix = np.zeros((len(signal_numbers), self.output_channels))
+        for row, signal_number in enumerate(signal_numbers):
+            controls = self.signal_controls[signal_number]
+            gains = self.signal_parameters[signal_number].get('routing_gains')
+            outputs = parse_channel_list(controls['routing_edit'].text(), self.output_channels)
+            if gains is not None:
+                # custom gains win over pan and output list, missing outputs stay silent
+                gains = np.asarray(gains, dtype=np.float64)[:self.output_channels]
+                matrix[row, :len(gains)] = gains
+            elif outputs:
+                matrix[row, outputs] = 1 / np.sqrt(2 * len(outputs))
+            else:
+                matrix[row] = pan_gains(controls['pan_dial'].value() / 100, self.output_channels)
+        self.routing = (signal_numbers, matrix)
+
+    def set_routing(self, signal_number, gains):
+        # arbitrary per-output gains for one signal, kept in its parameters until
+        # cleared with gains=None so later pan or output changes don't replace them
+        self.signal_parameters[signal_number]['routing_gains'] = None if gains is None else list(gains)
+        routing_edit = self.signal_controls[signal_number]['routing_edit']
+        routing_edit.setPlaceholderText("Panning" if gains is None else "Eigene Gains")
+        self.update_routing()
+
+    def set_output_channels(self, channels):
+        if channels == self.output_channels:
+            return
+        if self.recording or self.file_sink_running():
+            QtWidgets.QMessageBox.warning(self, "Channels", "Stop the recording and the file output before changing the number of channels.")
+            self.restore_output_controls()
+            return
+        if not self.output_settings_supported(self.output_device, self.sampling_rate, channels):
+            self.restore_output_controls()
+            return
 
+        was_running = self.running
+        self.stop()
+        self.output_channels = channels
+        self.update_routing()
+        if was_running:
+            self.start()
+
+    def set_output_device(self, device):
+        if device == self.output_device:
+            return
         if self.recording:
-            self.recorded_frames.append(stereo_wave.copy())
+            QtWidgets.QMessageBox.warning(self, "Audio Device", "Stop the recording before changing the output device.")
+            self.restore_output_controls()
+            return
+        if not self.output_settings_supported(device, self.sampling_rate, self.output_channels):
+            self.restore_output_controls()
+            return
 
+        was_running = self.running and not self.file_sink_running()
+        if was_running:
+            self.stop()
+        self.output_device = device
+        if was_running:
+            self.start()
+
+    def output_settings_supported(self, device, samplerate, channels):
+        # the file output takes any rate and channel count, devices are asked first
+        if self.output_combobox.currentData() == "file":
+            return True
+        try:
+            sd.check_output_settings(device=device, channels=channels, samplerate=samplerate)
+        except (sd.PortAudioError, ValueError) as error:
+            QtWidgets.QMessageBox.warning(self, "Audio Device", f"The output device does not support {channels} channels at {samplerate} Hz: {error}")
+            return False
+        return True
+
+    def restore_output_controls(self):
+        # puts the rate, channel and device controls back to the settings actually in use
+        for widget in (self.rate_combobox, self.channels_spinbox, self.device_combobox):
+            widget.blockSignals(True)
+        self.rate_combobox.setCurrentIndex(SAMPLING_RATES.index(self.sampling_rate))
+        self.channels_spinbox.setValue(self.output_channels)
+        devices = [self.device_combobox.itemData(index) for index in range(self.device_combobox.count())]
+        self.device_combobox.setCurrentIndex(devices.index(self.output_device) if self.output_device in devices else 0)
+        for widget in (self.rate_combobox, self.channels_spinbox, self.device_combobox):
+            widget.blockSignals(False)
+
+    def get_signal_filter(self, signal_number):
+        signal_filter = self.signal_filters.get(signal_number)
+        if signal_filter is None:
+            tables = self.get_rate_tables(self.sampling_rate)
+            signal_filter = BiquadFilter(self.sampling_rate, 1, tables['filter_coefficients'])
+            self.signal_filters[signal_number] = signal_filter
+        return signal_filter
+
+    def update_filter_parameters(self, signal_filter, signal_number):
+        controls = self.signal_controls[signal_number]
+        signal_filter.cutoff = controls['filter_cutoff_slider'].value()
+        signal_filter.resonance = controls['filter_resonance_slider'].value() / 10
+        signal_filter.lfo_freq = controls['filter_lfo_freq_slider'].value() / 10
+        signal_filter.lfo_depth = controls['filter_lfo_depth_slider'].value() / 10
+
+    def update_effect_parameters(self):
+        controls = self.effect_controls
+        effects = dict(self.master_effects)
+        delay = effects['delay']
+        delay.times = [controls['delay_time_left_slider'].value() / 1000, controls['delay_time_right_slider'].value() / 1000]
+        delay.feedback = controls['delay_feedback_slider'].value() / 100
+        delay.mix = controls['delay_mix_slider'].value() / 100
+        reverb = effects['reverb']
+        reverb.room_size = controls['reverb_room_size_slider'].value() / 100
+        reverb.mix = controls['reverb_mix_slider'].value() / 100
 
     def toggle_recording(self, state):
         if state:
-            self.recorded_frames = []
+            # frames are streamed to a temporary file so long takes don't pile up in memory
+            fd, self.record_path = tempfile.mkstemp(suffix=".wav")
+            os.close(fd)
+            self.record_writer = RecordingWriter(self.record_path, self.sampling_rate, self.output_channels)
             self.recording = True
             self.record_button.setText("Stop Recording")
         else:
@@ -478,15 +867,41 @@ class SineWaveApp(QtWidgets.QWidget):
             self.record_button.setText("Record")
             if self.running:
                 self.stop()
-            if self.recorded_frames:
-                self.save_recording()
+            if self.record_writer is not None:
+                record_writer = self.record_writer
+                self.record_writer = None
+                record_writer.close()
+                has_frames = record_writer.frames > 0
+                if has_frames:
+                    self.save_recording()
+                os.remove(self.record_path)
+                self.record_path = None
 
 
     def save_recording(self):
         filename, _ = QtWidgets.QFileDialog.getSaveFileName(self, "Save Recording", os.getenv("HOME"), "WAV Files (*.wav)")
-        if filename:
-            data = np.concatenate(self.recorded_frames, axis=0)
-            sf.write(filename, data, self.sampling_rate)
+        if not filename:
+            return
+
+        rates = [f"{rate / 1000:g} kHz" for rate in SAMPLING_RATES]
+        rate_name, ok = QtWidgets.QInputDialog.getItem(self, "Export Rate", "Sampling rate of the exported file:", rates, SAMPLING_RATES.index(self.sampling_rate), False)
+        if not ok:
+            return
+        export_rate = SAMPLING_RATES[rates.index(rate_name)]
+
+        self.export_recording(self.record_path, filename, export_rate)
+
+    def export_recording(self, source, filename, export_rate, block_frames=65536):
+        with sf.SoundFile(source) as infile, sf.SoundFile(filename, "w", samplerate=export_rate, channels=infile.channels) as outfile:
+            if export_rate == infile.samplerate:
+                for block in infile.blocks(blocksize=block_frames, always_2d=True):
+                    outfile.write(block)
+                return
+
+            resampler = PolyphaseResampler(infile.samplerate, export_rate, infile.channels)
+            for block in infile.blocks(blocksize=block_frames, always_2d=True):
+                outfile.write(resampler.process(block))
+            outfile.write(resampler.flush())
 
     def create_default_signal_parameters(self, frequency=220.0):
         return {
@@ -497,9 +912,17 @@ class SineWaveApp(QtWidgets.QWidget):
             'pan': 0.5,
             'waveform': 'sine',
             'mute': False,
+            'outputs': "",
+            'routing_gains': None,
+            'sample_loop': True,
+            'sample_root': 261.63,
             'phase_shift': 0,
             'fm_mod_freq': 0.0,
-            'fm_mod_index': 0.0
+            'fm_mod_index': 0.0,
+            'filter_cutoff': 20000,
+            'filter_resonance': 0.7,
+            'filter_lfo_freq': 0.0,
+            'filter_lfo_depth': 0.0
         }
 
     def add_new_signal(self):
@@ -520,20 +943,50 @@ class SineWaveApp(QtWidgets.QWidget):
     def remove_signal_tab(self, index):
         signal_number = list(self.signal_parameters.keys())[index]
         del self.signal_parameters[signal_number]
+        self.update_routing()
         del self.signal_controls[signal_number]
+        self.signal_filters.pop(signal_number, None)
+        self.sample_voices.pop(signal_number, None)
         self.tab_widget.removeTab(index)
 
+    def file_sink_running(self):
+        return self.running and isinstance(self.stream, FileSink)
+
+    def create_output_stream(self):
+        if self.output_combobox.currentData() == "file":
+            filename, _ = QtWidgets.QFileDialog.getSaveFileName(self, "Output File", os.getenv("HOME"), "WAV Files (*.wav)")
+            if not filename:
+                return None
+            return FileSink(filename, self.sampling_rate, self.output_channels, self.audio_callback, self.blocksize)
+        return sd.OutputStream(
+            samplerate=self.sampling_rate,
+            channels=self.output_channels,
+            device=self.output_device,
+            callback=self.audio_callback,
+            blocksize=self.blocksize
+        )
+
     def start(self):
         if not self.running:
+            try:
+                stream = self.create_output_stream()
+            except sd.PortAudioError as error:
+                QtWidgets.QMessageBox.warning(self, "Audio Device", f"Could not open the output device: {error}")
+                return
+            if stream is None:
+                return
+            self.stream = stream
             self.running = True
             self.sample_offset = 0
-            self.stream = sd.OutputStream(
-                samplerate=self.sampling_rate,
-                channels=2,
-                callback=self.audio_callback,
-                blocksize=1024
-            )
-            self.stream.start()
+            for voice in self.sample_voices.values():
+                voice.retrigger()
+            self.build_effects()
+            try:
+                self.stream.start()
+            except sd.PortAudioError as error:
+                self.running = False
+                self.stream.close()
+                QtWidgets.QMessageBox.warning(self, "Audio Device", f"Could not start playback: {error}")
 
     def stop(self):
         if self.running:
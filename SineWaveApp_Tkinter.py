@@ -5,6 +5,8 @@ import sounddevice as sd
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 
+SAMPLING_RATES = [44100, 48000, 96000, 192000]
+
 class SineWaveApp:
     def __init__(self, root):
         self.root = root
@@ -17,6 +19,12 @@ class SineWaveApp:
         self.volume = tk.DoubleVar(value=0.5)
         self.pan = tk.DoubleVar(value=0.5)
         self.waveform = tk.StringVar(value="sine")
+        self.sampling_rate = 44100
+        self.sampling_rate_var = tk.IntVar(value=self.sampling_rate)
+        self.blocksize = 1024
+        self.plot_duration = 0.02
+        # rate dependent time axes, built once per rate
+        self.rate_tables = {}
         self.running = False
 
         self.create_gui()
@@ -69,6 +77,11 @@ class SineWaveApp:
         self.waveform_combobox.option_add('*TCombobox*Listbox.font', font_large)
         self.waveform_combobox.pack(fill="x", pady=5)
 
+        ttk.Label(self.control_frame, text="Abtastrate (Hz):", font=font_large).pack()
+        self.rate_combobox = ttk.Combobox(self.control_frame, textvariable=self.sampling_rate_var, values=SAMPLING_RATES, state='readonly')
+        self.rate_combobox.bind("<<ComboboxSelected>>", lambda event: self.set_sampling_rate(self.sampling_rate_var.get()))
+        self.rate_combobox.pack(fill="x", pady=5)
+
         self.start_button = ttk.Button(self.control_frame, text="Start", command=self.start, style='TButton')
         self.start_button.pack(side="left", padx=20, pady=20)
         self.start_button.config(width=10)
@@ -80,7 +93,7 @@ class SineWaveApp:
         self.fig, self.ax = plt.subplots()
         self.line, = self.ax.plot([], [])
         self.ax.set_ylim(-1.5, 1.5)
-        self.ax.set_xlim(0, 0.02)
+        self.ax.set_xlim(0, self.plot_duration)
         self.ax.set_xlabel("Zeit (s)", fontsize=14)
         self.ax.set_ylabel("Amplitude", fontsize=14)
         self.canvas = FigureCanvasTkAgg(self.fig, master=self.plot_frame)
@@ -97,9 +110,28 @@ class SineWaveApp:
         self.pan_value_label.config(text=f"{self.pan.get():.2f}")
         self.root.after(50, self.update_labels)
 
+    def get_rate_tables(self, fs):
+        tables = self.rate_tables.get(fs)
+        if tables is None:
+            tables = {
+                'plot_time': np.arange(int(self.plot_duration * fs)) / fs,
+                'block_time': np.arange(self.blocksize) / fs,
+            }
+            self.rate_tables[fs] = tables
+        return tables
+
+    def set_sampling_rate(self, rate):
+        if rate == self.sampling_rate:
+            return
+        was_running = self.running
+        self.stop()
+        self.sampling_rate = rate
+        if was_running:
+            self.start()
+
     def update_plot(self):
-        fs = 44100
-        t = np.linspace(0, 0.02, int(0.02 * fs), endpoint=False)
+        fs = self.sampling_rate
+        t = self.get_rate_tables(fs)['plot_time']
 
         freq = self.frequency.get()
         mod_freq = self.mod_freq.get()
@@ -138,8 +170,12 @@ class SineWaveApp:
             outdata[:] = np.zeros((frames, 2))
             return
 
-        fs = 44100
-        t = (np.arange(frames) + self.sample_offset) / fs
+        fs = self.sampling_rate
+        block_time = self.get_rate_tables(fs)['block_time']
+        if frames == len(block_time):
+            t = block_time + self.sample_offset / fs
+        else:
+            t = (np.arange(frames) + self.sample_offset) / fs
         self.sample_offset += frames
 
         freq = self.frequency.get()
@@ -176,10 +212,10 @@ class SineWaveApp:
             self.running = True
             self.sample_offset = 0
             self.stream = sd.OutputStream(
-                samplerate=44100,
+                samplerate=self.sampling_rate,
                 channels=2,
                 callback=self.audio_callback,
-                blocksize=1024
+                blocksize=self.blocksize
             )
             self.stream.start()
 
@@ -0,0 +1,382 @@
+import numpy as np
+import scipy.signal
+import os
+import collections
+import struct
+from math import gcd
+
+
+def pan_gains(pan, channels):
+    # equal-power pan between the two outputs nearest to the pan position
+    gains = np.zeros(channels)
+    if channels == 1:
+        gains[0] = 1 / np.sqrt(2)
+        return gains
+    position = pan * (channels - 1)
+    lower = min(int(position), channels - 2)
+    fraction = position - lower
+    gains[lower] = np.cos(fraction * np.pi / 2) / np.sqrt(2)
+    gains[lower + 1] = np.sin(fraction * np.pi / 2) / np.sqrt(2)
+    return gains
+
+
+def parse_channel_list(text, channels):
+    # "1, 3-5" -> [0, 2, 3, 4], outputs beyond the channel count are ignored
+    selected = []
+    for part in text.replace(" ", "").split(","):
+        if not part:
+            continue
+        first, _, last = part.partition("-")
+        try:
+            first = int(first)
+            last = int(last) if last else first
+        except ValueError:
+            return []
+        # clamp before looping, the text field accepts arbitrarily large numbers
+        for channel in range(max(first, 1), min(last, channels) + 1):
+            if channel - 1 not in selected:
+                selected.append(channel - 1)
+    return selected
+
+
+class PolyphaseResampler:
+    # streaming rational resampler (up/down) with a windowed-sinc polyphase filter,
+    # keeps the input history between blocks so files can be converted chunk by chunk
+    def __init__(self, rate_in, rate_out, channels, taps_per_phase=32):
+        g = gcd(rate_in, rate_out)
+        self.up = rate_out // g
+        self.down = rate_in // g
+        self.channels = channels
+
+        # the filter length follows the larger factor so the transition band stays
+        # narrow when downsampling, padded to whole phases
+        num_taps = -(-taps_per_phase * max(self.up, self.down) // self.up) * self.up
+        self.taps_per_phase = num_taps // self.up
+        cutoff = 0.5 / max(self.up, self.down) * 0.95
+        # centre the filter on a whole output sample so the group delay can be skipped exactly
+        self.skip = int(round((num_taps - 1) / 2 / self.down))
+        n = np.arange(num_taps) - self.skip * self.down
+        h = 2 * cutoff * np.sinc(2 * cutoff * n) * np.kaiser(num_taps, 8.0) * self.up
+        # phases[p, k] = h[p + k * up], taps reversed so a block is a plain dot product
+        self.phases = h.reshape(self.taps_per_phase, self.up).T[:, ::-1].copy()
+
+        self.history = np.zeros((self.taps_per_phase - 1, channels))
+        self.input_count = 0
+        self.output_count = 0
+        self.samples_in = 0
+        self.samples_out = 0
+
+    def process(self, block):
+        block = np.asarray(block, dtype=np.float64).reshape(-1, self.channels)
+        self.samples_in += len(block)
+        out = self._filter(block)
+        self.samples_out += len(out)
+        return out
+
+    def flush(self):
+        # push zeros through the filter until the output length matches the input duration
+        expected = -(-self.samples_in * self.up // self.down)
+        out = self._filter(np.zeros((self.taps_per_phase, self.channels)))
+        out = out[:max(expected - self.samples_out, 0)]
+        self.samples_out += len(out)
+        return out
+
+    def _filter(self, block):
+        buffer = np.concatenate((self.history, block), axis=0)
+        first_index = self.input_count - (self.taps_per_phase - 1)
+        self.input_count += len(block)
+
+        # every output sample whose newest input sample is already available
+        last_output = (self.input_count * self.up - 1) // self.down
+        n = np.arange(self.output_count, last_output + 1)
+        self.output_count = last_output + 1
+
+        out = np.empty((len(n), self.channels))
+        if len(n):
+            pos = n * self.down
+            starts = pos // self.up - first_index - (self.taps_per_phase - 1)
+            phase = pos % self.up
+            # windows[i] is buffer[i:i + taps] as a view, nothing is copied per output
+            windows = np.lib.stride_tricks.sliding_window_view(buffer, self.taps_per_phase, axis=0)
+            # outputs k, k + up, k + 2 up, ... share a phase and their windows are `down` samples apart
+            for k in range(min(self.up, len(n))):
+                count = len(range(k, len(n), self.up))
+                view = windows[starts[k]:starts[k] + (count - 1) * self.down + 1:self.down]
+                out[k::self.up] = np.einsum('mck,k->mc', view, self.phases[phase[k]])
+
+        self.history = buffer[len(buffer) - (self.taps_per_phase - 1):]
+
+        if self.skip:
+            dropped = min(self.skip, len(out))
+            out = out[dropped:]
+            self.skip -= dropped
+        return out
+
+
+class BlockProfiler:
+    # keeps the recent per-block processing time of each stage of the audio callback
+    def __init__(self, history=200):
+        self.history = history
+        self.timings = {}
+        self.budget = None
+
+    def record(self, name, seconds):
+        timings = self.timings.get(name)
+        if timings is None:
+            timings = self.timings[name] = collections.deque(maxlen=self.history)
+        timings.append(seconds)
+
+    def set_budget(self, frames, fs):
+        self.budget = frames / fs
+
+    def load(self):
+        # mean cost of each stage as a fraction of the real-time budget of one block
+        if not self.budget:
+            return {}
+        return {name: np.mean(timings) / self.budget for name, timings in list(self.timings.items()) if timings}
+
+    def reset(self):
+        self.timings = {}
+
+
+class MappedSample:
+    # WAV file whose data chunk is memory-mapped, frames are only read from disk when indexed
+    dtypes = {
+        (1, 8): np.uint8,
+        (1, 16): np.dtype('<i2'),
+        (1, 24): np.uint8,
+        (1, 32): np.dtype('<i4'),
+        (3, 32): np.dtype('<f4'),
+        (3, 64): np.dtype('<f8'),
+    }
+
+    def __init__(self, filename):
+        self.filename = filename
+        fmt = None
+        with open(filename, 'rb') as f:
+            riff, _, wave = struct.unpack('<4sI4s', f.read(12))
+            if riff != b'RIFF' or wave != b'WAVE':
+                raise ValueError(f"{os.path.basename(filename)} is not a WAV file")
+            while True:
+                header = f.read(8)
+                if len(header) < 8:
+                    raise ValueError(f"{os.path.basename(filename)} has no data chunk")
+                chunk_id, size = struct.unpack('<4sI', header)
+                if chunk_id == b'fmt ':
+                    fmt = f.read(size + (size & 1))
+                elif chunk_id == b'data':
+                    offset = f.tell()
+                    break
+                else:
+                    f.seek(size + (size & 1), 1)
+        if fmt is None:
+            raise ValueError(f"{os.path.basename(filename)} has no format chunk")
+
+        format_tag, self.channels, self.samplerate, _, block_align, self.bits = struct.unpack('<HHIIHH', fmt[:16])
+        if format_tag == 0xFFFE:
+            # WAVE_FORMAT_EXTENSIBLE keeps the real format in the sub-format GUID
+            format_tag = struct.unpack('<H', fmt[24:26])[0]
+        dtype = self.dtypes.get((format_tag, self.bits))
+        if dtype is None:
+            raise ValueError(f"{os.path.basename(filename)}: unsupported WAV format ({format_tag}, {self.bits} bit)")
+        self.format_tag = format_tag
+        if self.channels == 0 or block_align != self.channels * -(-self.bits // 8):
+            raise ValueError(f"{os.path.basename(filename)}: inconsistent WAV header (block align {block_align})")
+
+        # streaming writers may leave the data size at 0 or 0xFFFFFFFF, use the file size then
+        available = os.path.getsize(filename) - offset
+        if size in (0, 0xFFFFFFFF):
+            size = available
+        self.frames = min(size, available) // block_align
+        shape = (self.frames, self.channels, 3) if self.bits == 24 else (self.frames, self.channels)
+        self.data = np.memmap(filename, dtype=dtype, mode='r', offset=offset, shape=shape)
+
+    def read(self, index):
+        # decodes the requested frames to float and mixes them down to mono
+        rows = self.data[index]
+        if self.bits == 24:
+            rows = rows.astype(np.int32)
+            values = (rows[..., 0] | (rows[..., 1] << 8) | (rows[..., 2] << 16)) << 8
+            values = (values >> 8) / 2**23
+        elif self.bits == 8:
+            values = (rows.astype(np.float64) - 128) / 128
+        elif self.format_tag == 1:
+            values = rows / 2**(self.bits - 1)
+        else:
+            values = rows.astype(np.float64)
+        return values.mean(axis=1)
+
+
+class SampleVoice:
+    # plays a MappedSample at a pitch relative to its root frequency, one block at a time
+    def __init__(self, sample, root_frequency=261.63, loop=True):
+        self.sample = sample
+        self.root_frequency = root_frequency
+        self.loop = loop
+        self.position = 0.0
+
+    def retrigger(self):
+        self.position = 0.0
+
+    def render(self, frequency, fs, advance=True):
+        # frequency is per output sample so FM sweeps the playback rate within the block
+        frames = len(frequency)
+        length = self.sample.frames
+        if length < 2:
+            return np.zeros(frames)
+
+        increments = frequency / self.root_frequency * self.sample.samplerate / fs
+        start = self.position if advance else 0.0
+        positions = start + np.cumsum(increments) - increments
+        if advance:
+            self.position = start + np.sum(increments)
+            if self.loop:
+                self.position %= length
+
+        if self.loop:
+            positions %= length
+            valid = np.ones(frames, dtype=bool)
+        else:
+            valid = (positions >= 0) & (positions <= length - 1)
+
+        index = np.floor(positions[valid]).astype(np.int64)
+        fraction = positions[valid] - index
+        following = (index + 1) % length if self.loop else np.minimum(index + 1, length - 1)
+
+        wave = np.zeros(frames)
+        if len(index):
+            current = self.sample.read(index)
+            wave[valid] = current + fraction * (self.sample.read(following) - current)
+        return wave
+
+
+class FeedbackDelayLine:
+    # circular buffer preallocated once, v[n] = x[n] + feedback * v[n - delay]
+    def __init__(self, max_delay, channels):
+        self.buffer = np.zeros((max_delay + 1, channels))
+        self.position = 0
+
+    def process(self, x, delay, feedback):
+        # returns v[n - delay]; blocks longer than the delay are split so every
+        # chunk only reads samples written by earlier chunks
+        size = len(self.buffer)
+        delay = min(max(delay, 1), size - 1)
+        out = np.empty_like(x)
+        start = 0
+        while start < len(x):
+            stop = min(start + delay, len(x))
+            index = (self.position + np.arange(stop - start)) % size
+            delayed = self.buffer[index - delay]
+            self.buffer[index] = x[start:stop] + feedback * delayed
+            out[start:stop] = delayed
+            self.position = (self.position + stop - start) % size
+            start = stop
+        return out
+
+
+class BiquadFilter:
+    # resonant lowpass (RBJ cookbook) with an LFO on the cutoff, evaluated per sub-block
+    def __init__(self, fs, channels, coefficient_cache, sub_block=64):
+        self.fs = fs
+        self.coefficient_cache = coefficient_cache
+        self.sub_block = sub_block
+        self.zi = np.zeros((2, channels))
+        self.bypassed = True
+        self.cutoff = 20000.0
+        self.resonance = 0.7
+        self.lfo_freq = 0.0
+        self.lfo_depth = 0.0
+
+    def coefficients(self, cutoff):
+        # cutoffs are quantized to 1/48 octave so the per-rate cache stays small
+        step = int(round(48 * np.log2(cutoff)))
+        key = (step, round(self.resonance, 2))
+        coefficients = self.coefficient_cache.get(key)
+        if coefficients is None:
+            w0 = 2 * np.pi * 2 ** (step / 48) / self.fs
+            alpha = np.sin(w0) / (2 * self.resonance)
+            cos_w0 = np.cos(w0)
+            b = np.array([(1 - cos_w0) / 2, 1 - cos_w0, (1 - cos_w0) / 2])
+            a = np.array([1 + alpha, -2 * cos_w0, 1 - alpha])
+            coefficients = self.coefficient_cache[key] = (b / a[0], a / a[0])
+        return coefficients
+
+    def cutoff_at(self, t):
+        cutoff = self.cutoff * 2 ** (self.lfo_depth * np.sin(2 * np.pi * self.lfo_freq * t))
+        return min(max(cutoff, 20.0), 0.45 * self.fs)
+
+    def process(self, block, t0):
+        if self.cutoff >= 20000 and self.lfo_depth == 0:
+            self.bypassed = True
+            return block
+        if self.bypassed:
+            # state from before the bypass no longer matches the signal
+            self.zi[:] = 0
+            self.bypassed = False
+
+        if self.lfo_depth == 0 or self.lfo_freq == 0:
+            b, a = self.coefficients(self.cutoff_at(t0))
+            out, self.zi = scipy.signal.lfilter(b, a, block, axis=0, zi=self.zi)
+            return out
+
+        # the LFO moves the coefficients every sub-block, zi carries over between them
+        out = np.empty_like(block)
+        for start in range(0, len(block), self.sub_block):
+            stop = min(start + self.sub_block, len(block))
+            b, a = self.coefficients(self.cutoff_at(t0 + start / self.fs))
+            out[start:stop], self.zi = scipy.signal.lfilter(b, a, block[start:stop], axis=0, zi=self.zi)
+        return out
+
+
+class StereoDelay:
+    # even outputs share one line with the left delay time, odd outputs one with the right,
+    # so the work per block does not grow with the channel count
+    def __init__(self, fs, channels=2, max_time=2.0):
+        self.fs = fs
+        self.lines = [FeedbackDelayLine(int(max_time * fs), len(range(side, channels, 2))) for side in range(2)]
+        self.times = [0.3, 0.45]
+        self.feedback = 0.3
+        self.mix = 0.0
+
+    def process(self, block, t0):
+        if self.mix == 0:
+            return block
+        wet = np.empty_like(block)
+        for side, line in enumerate(self.lines):
+            if block[:, side::2].shape[1]:
+                wet[:, side::2] = line.process(block[:, side::2], int(self.times[side] * self.fs), self.feedback)
+        return (1 - self.mix) * block + self.mix * wet
+
+
+class Reverb:
+    # Schroeder reverb: four parallel feedback combs into two series allpasses
+    comb_times = [0.0253, 0.0269, 0.0290, 0.0307]
+    allpass_times = [0.0126, 0.0100]
+
+    def __init__(self, fs, delay_cache, channels=2):
+        self.fs = fs
+        if 'reverb' not in delay_cache:
+            delay_cache['reverb'] = (
+                [int(delay_time * fs) for delay_time in self.comb_times],
+                [int(delay_time * fs) for delay_time in self.allpass_times],
+            )
+        self.comb_delays, self.allpass_delays = delay_cache['reverb']
+        self.combs = [FeedbackDelayLine(delay, channels) for delay in self.comb_delays]
+        self.allpasses = [FeedbackDelayLine(delay, channels) for delay in self.allpass_delays]
+        self.allpass_gain = 0.5
+        self.room_size = 0.5
+        self.mix = 0.0
+
+    def process(self, block, t0):
+        if self.mix == 0:
+            return block
+        feedback = 0.7 + 0.28 * self.room_size
+        wet = np.zeros_like(block)
+        for comb, delay in zip(self.combs, self.comb_delays):
+            wet += comb.process(block, delay, feedback)
+        wet *= 0.25
+        g = self.allpass_gain
+        for allpass, delay in zip(self.allpasses, self.allpass_delays):
+            delayed = allpass.process(wet, delay, g)
+            wet = -g * wet + (1 - g * g) * delayed
+        return (1 - self.mix) * block + self.mix * wet
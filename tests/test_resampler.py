@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+import scipy.signal
+
+from audio_dsp import PolyphaseResampler
+
+
+def tone_level(y, freq, fs):
+    # magnitude of one frequency in dB, measured away from the edges
+    y = y[len(y) // 4:-len(y) // 4]
+    t = np.arange(len(y)) / fs
+    return 20 * np.log10(2 * np.abs(np.mean(y * np.exp(-2j * np.pi * freq * t))) + 1e-12)
+
+
+def resample_in_blocks(x, rate_in, rate_out, seed=0):
+    resampler = PolyphaseResampler(rate_in, rate_out, 1)
+    rng = np.random.default_rng(seed)
+    outs = []
+    start = 0
+    while start < len(x):
+        stop = start + int(rng.integers(1, 5000))
+        outs.append(resampler.process(x[start:stop]))
+        start = stop
+    outs.append(resampler.flush())
+    return np.concatenate(outs)[:, 0]
+
+
+@pytest.mark.parametrize("rate_in, rate_out, tone, alias", [
+    (192000, 48000, 30000, 18000),
+    (96000, 44100, 26000, 18100),
+])
+def test_stopband_matches_resample_poly(rate_in, rate_out, tone, alias):
+    x = np.sin(2 * np.pi * tone * np.arange(rate_in) / rate_in)
+    y = resample_in_blocks(x, rate_in, rate_out)
+
+    g = np.gcd(rate_in, rate_out)
+    reference = scipy.signal.resample_poly(x, rate_out // g, rate_in // g)
+
+    assert len(y) == len(reference)
+    assert tone_level(y, alias, rate_out) <= tone_level(reference, alias, rate_out)
+
+
+@pytest.mark.parametrize("rate_in, rate_out", [(44100, 48000), (192000, 48000), (48000, 96000)])
+def test_passband_tone_is_preserved(rate_in, rate_out):
+    x = np.sin(2 * np.pi * 1000 * np.arange(rate_in) / rate_in)
+    y = resample_in_blocks(x, rate_in, rate_out)
+
+    reference = np.sin(2 * np.pi * 1000 * np.arange(len(y)) / rate_out)
+    assert len(y) == rate_out
+    assert np.max(np.abs(y[200:-200] - reference[200:-200])) < 0.01
+
+
+def test_block_size_does_not_change_output():
+    x = np.random.default_rng(1).standard_normal(20000)
+    whole = PolyphaseResampler(44100, 48000, 1)
+    expected = np.concatenate((whole.process(x), whole.flush()))[:, 0]
+
+    np.testing.assert_allclose(resample_in_blocks(x, 44100, 48000, seed=2), expected)
@@ -0,0 +1,131 @@
+import struct
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+from audio_dsp import MappedSample, SampleVoice
+
+
+def write_wav(path, data, samplerate=48000, subtype="PCM_16", format="WAV"):
+    sf.write(path, data, samplerate, subtype=subtype, format=format)
+    return str(path)
+
+
+def random_signal(frames=1000, channels=2):
+    # covers both signs so the 24-bit sign extension is exercised
+    rng = np.random.default_rng(0)
+    return rng.uniform(-0.9, 0.9, (frames, channels))
+
+
+def set_data_size(path, size):
+    raw = bytearray(open(path, "rb").read())
+    index = raw.index(b"data")
+    raw[index + 4:index + 8] = struct.pack("<I", size)
+    open(path, "wb").write(raw)
+
+
+@pytest.mark.parametrize("subtype", ["PCM_U8", "PCM_16", "PCM_24", "PCM_32", "FLOAT", "DOUBLE"])
+def test_read_matches_soundfile(tmp_path, subtype):
+    path = write_wav(tmp_path / "sample.wav", random_signal(), subtype=subtype)
+    sample = MappedSample(path)
+    expected, samplerate = sf.read(path, always_2d=True)
+
+    assert sample.frames == len(expected)
+    assert sample.samplerate == samplerate
+    np.testing.assert_allclose(sample.read(np.arange(sample.frames)), expected.mean(axis=1), atol=1e-12)
+
+
+@pytest.mark.parametrize("subtype", ["PCM_24", "FLOAT"])
+def test_wave_format_extensible(tmp_path, subtype):
+    path = write_wav(tmp_path / "sample.wav", random_signal(channels=4), subtype=subtype, format="WAVEX")
+    with open(path, "rb") as f:
+        assert b"\xfe\xff" in f.read(64)
+    sample = MappedSample(path)
+    expected, _ = sf.read(path, always_2d=True)
+
+    np.testing.assert_allclose(sample.read(np.arange(sample.frames)), expected.mean(axis=1), atol=1e-12)
+
+
+@pytest.mark.parametrize("size", [0, 0xFFFFFFFF])
+def test_unset_data_size_uses_file_size(tmp_path, size):
+    data = random_signal()
+    path = write_wav(tmp_path / "sample.wav", data)
+    expected, _ = sf.read(path, always_2d=True)
+    set_data_size(path, size)
+
+    sample = MappedSample(path)
+    assert sample.frames == len(data)
+    np.testing.assert_allclose(sample.read(np.arange(sample.frames)), expected.mean(axis=1), atol=1e-12)
+
+
+def test_invalid_block_align_is_rejected(tmp_path):
+    path = write_wav(tmp_path / "sample.wav", random_signal())
+    raw = bytearray(open(path, "rb").read())
+    index = raw.index(b"fmt ")
+    raw[index + 20:index + 22] = struct.pack("<H", 0)
+    open(path, "wb").write(raw)
+
+    with pytest.raises(ValueError):
+        MappedSample(path)
+
+
+def test_not_a_wav_file(tmp_path):
+    path = tmp_path / "sample.wav"
+    path.write_bytes(b"\0" * 64)
+
+    with pytest.raises(ValueError):
+        MappedSample(str(path))
+
+
+@pytest.fixture
+def sample(tmp_path):
+    path = write_wav(tmp_path / "sample.wav", random_signal(frames=100, channels=1), subtype="FLOAT")
+    return MappedSample(path)
+
+
+def test_unity_pitch_plays_the_samples(sample):
+    voice = SampleVoice(sample, root_frequency=440.0, loop=False)
+    frequency = np.full(40, 440.0)
+    expected = sample.read(np.arange(80))
+
+    first = voice.render(frequency, sample.samplerate)
+    second = voice.render(frequency, sample.samplerate)
+    np.testing.assert_allclose(np.concatenate((first, second)), expected)
+
+
+def test_half_speed_interpolates_between_frames(sample):
+    voice = SampleVoice(sample, root_frequency=440.0, loop=False)
+    out = voice.render(np.full(20, 220.0), sample.samplerate)
+    frames = sample.read(np.arange(11))
+
+    np.testing.assert_allclose(out[0::2], frames[:10])
+    np.testing.assert_allclose(out[1::2], (frames[:10] + frames[1:11]) / 2)
+
+
+def test_loop_wraps_past_the_end(sample):
+    voice = SampleVoice(sample, root_frequency=440.0, loop=True)
+    frequency = np.full(64, 440.0)
+    out = np.concatenate([voice.render(frequency, sample.samplerate) for _ in range(4)])
+
+    np.testing.assert_allclose(out, sample.read(np.arange(len(out)) % sample.frames))
+
+
+def test_one_shot_is_silent_after_the_end(sample):
+    voice = SampleVoice(sample, root_frequency=440.0, loop=False)
+    out = voice.render(np.full(150, 440.0), sample.samplerate)
+
+    np.testing.assert_allclose(out[:sample.frames], sample.read(np.arange(sample.frames)))
+    assert not np.any(out[sample.frames:])
+
+    voice.retrigger()
+    np.testing.assert_allclose(voice.render(np.full(10, 440.0), sample.samplerate), sample.read(np.arange(10)))
+
+
+def test_render_without_advance_keeps_the_position(sample):
+    voice = SampleVoice(sample, root_frequency=440.0)
+    voice.render(np.full(30, 440.0), sample.samplerate)
+    preview = voice.render(np.full(10, 440.0), sample.samplerate, advance=False)
+
+    np.testing.assert_allclose(preview, sample.read(np.arange(10)))
+    assert voice.position == 30